@@ -0,0 +1,157 @@
+import argparse
+import datetime
+import glob
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+# ==============================================================================
+# CONFIGURATION DES SAUVEGARDES
+# Module indépendant de Streamlit : utilisé par ticketapp.py et en ligne de commande
+# ==============================================================================
+
+DB_FILE = "oop_ticketing_geneva.db"
+BACKUP_DIR = "backups"
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.01
+BACKUP_TIMEOUT_SECONDS = 600
+INTERACTIVE_BACKUP_TIMEOUT_SECONDS = 30
+SNAPSHOT_RETENTION = {"auto": 7, "manual": 5, "pre_restore": 3}
+
+# ==============================================================================
+# SAUVEGARDE ET RESTAURATION
+# ==============================================================================
+
+def backup_database(conn, dest_file, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP, timeout=BACKUP_TIMEOUT_SECONDS):
+    """Copie la base à chaud via l'API de sauvegarde SQLite, par lots de pages pour ne pas bloquer les écritures.
+
+    La copie part de la connexion partagée de l'application : les écritures faites par cette connexion sont
+    reportées dans la copie sans la relancer depuis le début.
+    """
+    if conn.in_transaction:
+        raise sqlite3.OperationalError("Une transaction est en cours sur la connexion, sauvegarde impossible.")
+    deadline = time.monotonic() + timeout
+
+    def check_timeout(status, remaining, total):
+        if time.monotonic() > deadline:
+            raise sqlite3.OperationalError(f"Sauvegarde interrompue après {timeout} s ({remaining}/{total} pages restantes).")
+
+    dst = sqlite3.connect(dest_file)
+    try:
+        conn.backup(dst, pages=pages, progress=check_timeout, sleep=sleep)
+    finally:
+        dst.close()
+
+def check_database_integrity(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        rows = conn.execute("PRAGMA integrity_check").fetchall()
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        conn.close()
+    return [row[0] for row in rows] == ["ok"]
+
+def snapshot_path(kind, backup_dir=BACKUP_DIR, db_file=DB_FILE):
+    prefix = os.path.splitext(os.path.basename(db_file))[0]
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return os.path.join(backup_dir, f"{prefix}_{kind}_{stamp}.db")
+
+def list_snapshots(backup_dir=BACKUP_DIR, kind="*", db_file=DB_FILE):
+    prefix = os.path.splitext(os.path.basename(db_file))[0]
+    return sorted(glob.glob(os.path.join(backup_dir, f"{prefix}_{kind}_*.db")), key=os.path.getmtime, reverse=True)
+
+def prune_snapshots(kind, backup_dir=BACKUP_DIR, db_file=DB_FILE):
+    for snapshot in list_snapshots(backup_dir, kind, db_file)[SNAPSHOT_RETENTION[kind]:]:
+        os.remove(snapshot)
+
+def create_snapshot(conn, kind="auto", backup_dir=BACKUP_DIR, db_file=DB_FILE, timeout=BACKUP_TIMEOUT_SECONDS):
+    """Crée un instantané horodaté, vérifie son intégrité puis applique la rétention propre à son type."""
+    os.makedirs(backup_dir, exist_ok=True)
+    snapshot = snapshot_path(kind, backup_dir, db_file)
+    partial = f"{snapshot}.part"
+
+    try:
+        backup_database(conn, partial, timeout=timeout)
+        if not check_database_integrity(partial):
+            raise sqlite3.DatabaseError(f"L'instantané {snapshot} est corrompu.")
+        os.replace(partial, snapshot)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+    prune_snapshots(kind, backup_dir, db_file)
+    return snapshot
+
+def save_pre_restore_copy(conn, backup_dir=BACKUP_DIR, db_file=DB_FILE):
+    """Sauvegarde de sécurité au mieux : une base active corrompue ne doit jamais empêcher la restauration."""
+    try:
+        return create_snapshot(conn, "pre_restore", backup_dir, db_file, timeout=INTERACTIVE_BACKUP_TIMEOUT_SECONDS)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Copie de sécurité vérifiée impossible, copie brute du fichier : {e}")
+    try:
+        os.makedirs(backup_dir, exist_ok=True)
+        copy = snapshot_path("pre_restore", backup_dir, db_file)
+        shutil.copyfile(db_file, copy)
+        prune_snapshots("pre_restore", backup_dir, db_file)
+        return copy
+    except OSError as e:
+        print(f"Attention : aucune copie de sécurité avant restauration : {e}")
+        return None
+
+def restore_snapshot(conn, snapshot_file, backup_dir=BACKUP_DIR, db_file=DB_FILE):
+    """Remplace le contenu de la base active par celui d'un instantané, après une copie de sécurité."""
+    if not check_database_integrity(snapshot_file):
+        raise sqlite3.DatabaseError(f"L'instantané {snapshot_file} est corrompu.")
+    if conn.in_transaction:
+        raise sqlite3.OperationalError("Une transaction est en cours sur la connexion, restauration impossible.")
+    save_pre_restore_copy(conn, backup_dir, db_file)
+    src = sqlite3.connect(snapshot_file)
+    try:
+        src.backup(conn)
+    finally:
+        src.close()
+
+# ==============================================================================
+# LIGNE DE COMMANDE
+# ==============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sauvegarde et restauration de la base du portail de demandes, sans lancer l'application.")
+    parser.add_argument("--db", default=DB_FILE, help="Fichier de la base active")
+    parser.add_argument("--backup-dir", default=BACKUP_DIR, help="Répertoire des instantanés")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("backup", help="Créer un instantané manuel")
+    commands.add_parser("list", help="Lister les instantanés")
+    commands.add_parser("check", help="Vérifier l'intégrité d'un instantané").add_argument("snapshot")
+    commands.add_parser("restore", help="Restaurer la base depuis un instantané").add_argument("snapshot")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for snapshot in list_snapshots(args.backup_dir, db_file=args.db):
+            print(f"{snapshot}\t{os.path.getsize(snapshot) / 1024 ** 2:.1f} Mo")
+        return 0
+    if args.command == "check":
+        ok = check_database_integrity(args.snapshot)
+        print(f"{args.snapshot} : {'intégrité OK' if ok else 'intégrité compromise'}")
+        return 0 if ok else 1
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.command == "backup":
+            print(create_snapshot(conn, "manual", args.backup_dir, args.db))
+        else:
+            restore_snapshot(conn, args.snapshot, args.backup_dir, args.db)
+            print(f"Base {args.db} restaurée depuis {args.snapshot}.")
+    except (sqlite3.Error, OSError) as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,8 +8,12 @@ import plotly.express as px
 import plotly.graph_objects as go
 import time
 import base64
+import os
+import threading
 import sendgrid
 from sendgrid.helpers.mail import Mail
+from db_backup import (DB_FILE, INTERACTIVE_BACKUP_TIMEOUT_SECONDS, SNAPSHOT_RETENTION, check_database_integrity,
+                       create_snapshot, list_snapshots, restore_snapshot)
 
 # ==============================================================================
 # CONFIGURATION DE LA PAGE
@@ -29,6 +33,9 @@ st.set_page_config(
 # CONFIGURATION ET ENUMS
 # ==============================================================================
 
+BACKUP_INTERVAL_HOURS = 24
+BACKUP_RETRY_MINUTES = 60
+
 class TicketStatus(Enum):
     NOUVEAU = "Nouveau"
     EN_COURS = "En cours"
@@ -120,7 +127,7 @@ def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 @st.cache_resource
-def create_connection(db_file="oop_ticketing_geneva.db"):
+def create_connection(db_file=DB_FILE):
     try:
         return sqlite3.connect(db_file, check_same_thread=False)
     except sqlite3.Error as e:
@@ -179,6 +186,7 @@ def add_user(conn, username, password, email=None, full_name=None, department=No
         conn.commit()
         return cur.lastrowid
     except sqlite3.IntegrityError:
+        conn.rollback()
         return None
 
 def get_user(conn, username, password):
@@ -209,6 +217,7 @@ def delete_user(conn, user_id):
         cur.execute("DELETE FROM users WHERE id = ?", (user_id,))
         conn.commit()
     except sqlite3.Error as e:
+        conn.rollback()
         st.error(f"Erreur lors de la suppression de l'utilisateur : {e}")
 
 def create_ticket(conn, ticket_data):
@@ -220,16 +229,37 @@ def create_ticket(conn, ticket_data):
     conn.commit()
     return cur.lastrowid
 
+def to_enum_categorical(series, categories, ordered=False):
+    categories = list(categories)
+    categories += [v for v in series.dropna().unique() if v not in categories]
+    return series.astype(pd.CategoricalDtype(categories=categories, ordered=ordered))
+
 @st.cache_data(ttl=60)
 def get_tickets_for_user(_conn, user_id, is_analyst=False):
-    base_query = """SELECT t.*, u1.full_name as created_by, u2.full_name as assigned_to
+    """Charge la liste des tickets sans les champs texte longs, chargés à la demande via get_ticket_details."""
+    base_query = """SELECT t.id, t.title, t.ticket_type, t.category, t.priority, t.status, t.expected_delivery,
+                           t.created_by_id, t.assigned_to_id, t.created_at, t.updated_at, t.estimated_hours, t.actual_hours,
+                           u1.full_name as created_by, u2.full_name as assigned_to
                     FROM tickets t
                     LEFT JOIN users u1 ON t.created_by_id = u1.id
                     LEFT JOIN users u2 ON t.assigned_to_id = u2.id"""
     if is_analyst:
-        return pd.read_sql_query(f"{base_query} ORDER BY t.created_at DESC", _conn)
+        df = pd.read_sql_query(f"{base_query} ORDER BY t.created_at DESC", _conn)
     else:
-        return pd.read_sql_query(f"{base_query} WHERE t.created_by_id=? ORDER BY t.created_at DESC", _conn, params=(user_id,))
+        df = pd.read_sql_query(f"{base_query} WHERE t.created_by_id=? ORDER BY t.created_at DESC", _conn, params=(user_id,))
+    df['status'] = to_enum_categorical(df['status'], [s.value for s in TicketStatus])
+    # Ordre croissant d'urgence : Faible < Normale < Élevée < Critique
+    df['priority'] = to_enum_categorical(df['priority'], [p.value for p in reversed(TicketPriority)], ordered=True)
+    df['ticket_type'] = to_enum_categorical(df['ticket_type'], [t.value for t in TicketType])
+    df['category'] = to_enum_categorical(df['category'], [c.value for c in TicketCategory])
+    return df
+
+@st.cache_data(ttl=60)
+def get_ticket_details(_conn, ticket_id):
+    query = """SELECT description, business_justification, data_sources, technical_requirements
+               FROM tickets WHERE id = ?"""
+    details = pd.read_sql_query(query, _conn, params=(int(ticket_id),))
+    return None if details.empty else details.iloc[0]
 
 def update_ticket(conn, ticket_id, **kwargs):
     valid_kwargs = {k: v for k, v in kwargs.items() if v is not None}
@@ -290,6 +320,35 @@ def send_new_ticket_notification(ticket_id, ticket_title, creator_name):
         print(f"Erreur lors de l'envoi de l'e-mail : {e}")
         pass
 
+# ==============================================================================
+# SAUVEGARDES PLANIFIÉES (voir db_backup.py)
+# ==============================================================================
+
+@st.cache_resource
+def get_backup_state():
+    return {'lock': threading.Lock(), 'last_attempt': 0.0}
+
+def run_scheduled_backup(conn):
+    state = get_backup_state()
+    if time.time() - state['last_attempt'] < BACKUP_RETRY_MINUTES * 60:
+        return
+    snapshots = list_snapshots(kind="auto")
+    if snapshots and time.time() - os.path.getmtime(snapshots[0]) < BACKUP_INTERVAL_HOURS * 3600:
+        return
+    if not state['lock'].acquire(blocking=False):
+        return
+    state['last_attempt'] = time.time()
+
+    def worker():
+        try:
+            create_snapshot(conn)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Erreur lors de la sauvegarde automatique : {e}")
+        finally:
+            state['lock'].release()
+
+    threading.Thread(target=worker, daemon=True).start()
+
 # ==============================================================================
 # COMPOSANTS D'INTERFACE
 # ==============================================================================
@@ -476,7 +535,7 @@ def show_tickets_list():
         
         expander_title = f"**#{ticket['id']} - {ticket['title']}**"
         
-        with st.expander(expander_title, expanded=False):
+        with st.expander(expander_title, expanded=False, key=f"ticket_{ticket['id']}", on_change="rerun") as ticket_expander:
             if ticket['status'] == 'Terminé':
                 st.markdown('<div style="background-color:rgba(113, 128, 147, 0.1); padding: 1rem; border-radius: 0.5rem; margin-bottom: 1rem;">', unsafe_allow_html=True)
 
@@ -487,25 +546,30 @@ def show_tickets_list():
 
             main_cols = st.columns([2, 1])
             with main_cols[0]:
+                details = get_ticket_details(conn, ticket['id']) if ticket_expander.open else None
                 tab_details, tab_reqs, tab_analyst = st.tabs(["Détails", "Exigences", "Suivi Analyste"])
                 with tab_details:
                     st.markdown(f"**Demandeur :** {ticket['created_by']} | **Date :** {pd.to_datetime(ticket['created_at']).strftime('%d/%m/%Y')}")
-                    st.markdown(f"**Description:**\n> {ticket['description']}")
-                    st.markdown(f"**Justification Métier:**\n> {ticket['business_justification']}")
+                    if details is not None:
+                        st.markdown(f"**Description:**\n> {details['description']}")
+                        st.markdown(f"**Justification Métier:**\n> {details['business_justification']}")
+                    elif ticket_expander.open:
+                        st.warning("Cette demande n'existe plus.")
                     
                     is_creator = st.session_state['user_id'] == ticket['created_by_id']
                     can_be_edited = ticket['status'] == 'Nouveau'
-                    if is_creator and can_be_edited:
+                    if is_creator and can_be_edited and details is not None:
                         st.markdown("---")
                         if st.button("Modifier ma demande", key=f"edit_btn_{ticket['id']}", type="secondary"):
-                            st.session_state.ticket_to_edit = ticket
+                            st.session_state.ticket_to_edit = pd.concat([ticket, details])
                             st.session_state.view = "Modifier la demande"
                             st.rerun()
 
                 with tab_reqs:
                     st.markdown(f"**Type:** {ticket['ticket_type']} | **Catégorie:** {ticket['category']}")
-                    st.markdown(f"**Sources de données:** `{ticket['data_sources'] or 'N/A'}`")
-                    st.markdown(f"**Exigences techniques:**\n> {ticket['technical_requirements'] or 'Aucune'}")
+                    if details is not None:
+                        st.markdown(f"**Sources de données:** `{details['data_sources'] or 'N/A'}`")
+                        st.markdown(f"**Exigences techniques:**\n> {details['technical_requirements'] or 'Aucune'}")
                 with tab_analyst:
                     if st.session_state['is_analyst']:
                         with st.form(key=f"update_form_{ticket['id']}"):
@@ -590,6 +654,71 @@ def show_user_management_page():
                 st.session_state.user_to_delete = user
                 st.rerun()
 
+def show_backup_page():
+    st.markdown("<h2><i class='bi bi-database-fill-lock'></i> Sauvegardes de la base</h2>", unsafe_allow_html=True)
+    conn = create_connection()
+
+    if 'snapshot_to_restore' in st.session_state and st.session_state.snapshot_to_restore is not None:
+        snapshot = st.session_state.snapshot_to_restore
+        st.warning(f"Êtes-vous sûr de vouloir restaurer **{os.path.basename(snapshot)}** ? Toutes les modifications postérieures seront perdues (une sauvegarde de sécurité sera créée au préalable).")
+        col1, col2 = st.columns(2)
+        if col2.button("Annuler", use_container_width=True):
+            st.session_state.snapshot_to_restore = None
+            st.rerun()
+        if col1.button("Oui, restaurer cette sauvegarde", use_container_width=True, type="primary"):
+            lock = get_backup_state()['lock']
+            if not lock.acquire(blocking=False):
+                st.warning("Une sauvegarde est en cours, réessayez dans quelques instants.")
+                return
+            try:
+                with st.spinner("Restauration en cours..."):
+                    restore_snapshot(conn, snapshot)
+            except (sqlite3.Error, OSError) as e:
+                st.error(f"Erreur lors de la restauration : {e}")
+                return
+            finally:
+                lock.release()
+            st.cache_data.clear()
+            st.toast(f"Base restaurée depuis {os.path.basename(snapshot)}.", icon="♻️")
+            st.session_state.snapshot_to_restore = None
+            st.rerun()
+        return
+
+    st.info(f"Un instantané est créé automatiquement toutes les {BACKUP_INTERVAL_HOURS} h. Sont conservés les {SNAPSHOT_RETENTION['auto']} derniers instantanés automatiques, "
+            f"les {SNAPSHOT_RETENTION['manual']} derniers manuels et les {SNAPSHOT_RETENTION['pre_restore']} dernières copies de sécurité avant restauration. "
+            "En cas d'indisponibilité de l'application, utilisez `python db_backup.py restore <instantané>`.")
+    if st.button("Créer une sauvegarde maintenant", type="primary"):
+        lock = get_backup_state()['lock']
+        if not lock.acquire(blocking=False):
+            st.warning("Une sauvegarde est déjà en cours.")
+        else:
+            try:
+                with st.spinner("Sauvegarde en cours..."):
+                    snapshot = create_snapshot(conn, "manual", timeout=INTERACTIVE_BACKUP_TIMEOUT_SECONDS)
+                st.toast(f"Sauvegarde {os.path.basename(snapshot)} créée.", icon="💾")
+            except (sqlite3.Error, OSError) as e:
+                st.error(f"Erreur lors de la sauvegarde : {e}")
+            finally:
+                lock.release()
+
+    snapshots = list_snapshots()
+    if not snapshots:
+        st.info("Aucune sauvegarde disponible.")
+        return
+
+    for snapshot in snapshots:
+        cols = st.columns([3, 1, 1, 1])
+        cols[0].markdown(f"**{os.path.basename(snapshot)}**")
+        cols[1].caption(f"{os.path.getsize(snapshot) / 1024 ** 2:.1f} Mo")
+        if cols[2].button("Vérifier", key=f"check_{snapshot}", use_container_width=True):
+            if check_database_integrity(snapshot):
+                st.toast(f"{os.path.basename(snapshot)} : intégrité OK.", icon="✅")
+            else:
+                st.error(f"{os.path.basename(snapshot)} : intégrité compromise.")
+        if cols[3].button("Restaurer", key=f"restore_{snapshot}", use_container_width=True, type="secondary"):
+            st.session_state.snapshot_to_restore = snapshot
+            st.rerun()
+
 def show_profile_page():
     st.markdown(f"<h2><i class='bi bi-person-circle'></i> Profil de {st.session_state['full_name']}</h2>", unsafe_allow_html=True)
     st.write(f"**Nom d'utilisateur :** {st.session_state['username']}")
@@ -604,6 +733,7 @@ def show_profile_page():
 def main():
     load_css()
     run_setup()
+    run_scheduled_backup(create_connection())
     
     if 'logged_in' not in st.session_state: st.session_state['logged_in'] = False
     
@@ -632,6 +762,9 @@ def main():
                 if st.button("Gestion des utilisateurs", use_container_width=True, type="primary" if st.session_state.view == "Gestion des utilisateurs" else "secondary"):
                     st.session_state.view = "Gestion des utilisateurs"
                     st.rerun()
+                if st.button("Sauvegardes", use_container_width=True, type="primary" if st.session_state.view == "Sauvegardes" else "secondary"):
+                    st.session_state.view = "Sauvegardes"
+                    st.rerun()
                 
             st.markdown("---")
             if st.button("Mon Profil", use_container_width=True, type="primary" if st.session_state.view == "Mon Profil" else "secondary"):
@@ -668,6 +801,7 @@ def main():
                 st.session_state.view = "Suivi des demandes"
                 st.rerun()
         elif st.session_state.view == "Gestion des utilisateurs": show_user_management_page()
+        elif st.session_state.view == "Sauvegardes": show_backup_page()
         elif st.session_state.view == "Mon Profil": show_profile_page()
 
     else: